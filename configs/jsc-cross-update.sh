@@ -0,0 +1,35 @@
+#!/bin/bash
+
+# Copyright (c) 2021 Paulo Matos, Igalia S.L.
+#
+# Licensed under the BSD 3-Clause License
+# <LICENSE-BSD-3-Clause.rst or https://opensource.org/licenses/BSD-3-Clause>.
+# This file may not be copied, modified, or distributed except according to
+# those terms.
+
+# Builds JSC on this host (cross-compiling through the arch prefix of the build
+# command) and deploys the changed blocks of the build to the remote boards.
+#
+# $1 is the build command to execute.
+# $2 is the build directory.
+# $3 is the deployment directory on the boards.
+# The remaining arguments are the boards as user@host[:port].
+
+set -e
+
+BUILD=$1
+BUILD_DIR=$2
+REMOTE_DIR=$3
+shift 3
+
+git checkout main
+git reset --hard origin/main
+git pull origin main
+
+eval "${BUILD}"
+
+python3 "$(dirname "$0")/../scripts/deploy-jsc.py" \
+        --revision "$(git rev-parse HEAD)" \
+        --build-dir "${BUILD_DIR}" \
+        --remote-dir "${REMOTE_DIR}" \
+        "$@"
@@ -10,6 +10,8 @@ from .remotefile_writer_decorator import RemoteFileWriterDecorator
 from .subprocess_remotecall import SubprocessRemoteCall
 from .subprocess_jsccall import SubprocessJSCCall
 from .jsc_gdb_backtrace_decorator import JSCGdbBacktraceDecorator
+from .jsc_dedup_decorator import JSCDedupDecorator
+from .telemetry_decorator import TelemetryDecorator
 
 try:
     from .test_runner_subprocess_remotecall import TestRunnerSubprocessRemoteCall
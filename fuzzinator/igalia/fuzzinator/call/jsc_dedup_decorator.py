@@ -0,0 +1,137 @@
+# Copyright (c) 2021 Paulo Matos, Igalia S.L.
+#
+# Licensed under the BSD 3-Clause License
+# <LICENSE.rst or https://opensource.org/licenses/BSD-3-Clause>.
+# This file may not be copied, modified, or distributed except
+# according to those terms.
+
+import json
+import logging
+import os
+import time
+
+from fuzzinator.config import as_path
+from fuzzinator.call import CallableDecorator
+
+from ..dedup import get_filter, test_key
+from .subprocess_jsccall import random_options
+
+logger = logging.getLogger(__name__)
+
+
+class JSCDedupDecorator(CallableDecorator):
+    """
+    Decorator for :func:`igalia.fuzzinator.call.SubprocessJSCCall` to skip
+    executions whose outcome is already known: it selects the random options
+    of the call itself and looks up the test (with line endings and trailing
+    whitespace normalized), the options and the build in a persistent filter.
+
+      - Pairs known to be clean are not executed again. They are kept in a
+        bounded Bloom filter, so a small ratio (``error_rate``) of new pairs
+        is skipped as well.
+      - Pairs known to crash are not executed again but counted in the
+        filter.
+
+    Only executions that exit with 0 before ``timeout`` are recorded as clean
+    and only the ones exiting with one of ``exit_codes`` as crashing, nothing
+    is recorded for the others (e.g., timeouts). The decorator has to see the
+    outcome of the SUT before it is filtered, so it should directly wrap the
+    call or a decorator that returns it unchanged (e.g.,
+    :class:`igalia.fuzzinator.call.TelemetryDecorator`).
+
+    The filter is reset when the build changes (the modification time or the
+    size of ``build`` changes) and can be inspected or reset with
+    ``python -m igalia.fuzzinator.dedup``. Calls with given ``options`` (i.e.,
+    validation and reduction) are passed through.
+
+    **Mandatory parameters of the decorator:**
+
+      - ``path``: file of the filter, shared by all jobs.
+      - ``build``: path to the SUT binary, identifying the build.
+
+    **Optional parameters of the decorator:**
+
+      - ``timeout``: timeout of the decorated call in seconds, calls running at
+        least this long are considered timed out.
+      - ``exit_codes``: exit codes of crashing executions (default: any
+        non-zero exit code).
+      - ``capacity``: number of pairs after which the filter is reset (default:
+        1000000).
+      - ``error_rate``: false positive rate of the filter at capacity (default:
+        0.001).
+      - ``sync_every``: number of executions between merging the findings of
+        the job into the file (default: 1).
+
+    **Example configuration snippet:**
+
+        .. code-block:: ini
+
+            [sut.foo]
+            call=igalia.fuzzinator.call.SubprocessJSCCall
+            call.decorate(0)=igalia.fuzzinator.call.JSCDedupDecorator
+
+            [sut.foo.call]
+            command=./bin/jsc {options} {test}
+            cwd=/home/alice/WebKit
+            timeout=10
+
+            [sut.foo.call.decorate(0)]
+            path=${fuzzinator:work_dir}/dedup.bin
+            build=/home/alice/WebKit/bin/jsc
+            timeout=${sut.foo.call:timeout}
+            exit_codes=[-11, -6]
+    """
+
+    def decorator(self, path, build, timeout=None, exit_codes=None, capacity=None, error_rate=None, sync_every=None, **kwargs):
+        timeout = float(timeout) if timeout else None
+        exit_codes = json.loads(exit_codes) if exit_codes else None
+        filter_kwargs = dict()
+        if capacity:
+            filter_kwargs['capacity'] = int(capacity)
+        if error_rate:
+            filter_kwargs['error_rate'] = float(error_rate)
+        if sync_every:
+            filter_kwargs['sync_every'] = int(sync_every)
+        path = as_path(path)
+        build = as_path(build)
+
+        def wrapper(fn):
+            def filter(*args, **kwargs):
+                if 'options' in kwargs:
+                    return fn(*args, **kwargs)
+
+                options = random_options()
+                try:
+                    st = os.stat(build)
+                    build_id = '{mtime}-{size}'.format(mtime=st.st_mtime_ns, size=st.st_size)
+
+                    test = kwargs['test']
+                    if isinstance(test, str):
+                        with open(test, 'rb') as f:
+                            test = f.read()
+
+                    key = test_key(test, options, build_id)
+                    dedup_filter = get_filter(path, **filter_kwargs)
+                    if dedup_filter.lookup(key, build_id):
+                        return None
+                except Exception as e:
+                    logger.warning('Failed to look up execution in dedup filter', exc_info=e)
+                    return fn(*args, options=options, **kwargs)
+
+                start = time.perf_counter()
+                issue = fn(*args, options=options, **kwargs)
+                if timeout is not None and time.perf_counter() - start >= timeout:
+                    return issue
+
+                exit_code = issue.get('exit_code', 0) if issue is not None else 0
+                try:
+                    if exit_code == 0:
+                        dedup_filter.add(key)
+                    elif exit_codes is None or exit_code in exit_codes:
+                        dedup_filter.add(key, crash=True)
+                except Exception as e:
+                    logger.warning('Failed to record execution in dedup filter', exc_info=e)
+                return issue
+
+            return filter
+        return wrapper
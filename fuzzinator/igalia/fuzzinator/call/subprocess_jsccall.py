@@ -36,6 +36,15 @@ class FormatDict(dict):
     def __missing__(self, key):
         return FormatPlaceholder(key)
 
+# Randomly selects a set of arguments from JSC_MULTI_ARGS
+def random_options():
+    # Add the args randomly
+    options_list = random.sample(JSC_MULTI_ARGS,
+                                 k=random.randint(0, len(JSC_MULTI_ARGS)))
+
+    # Build options
+    return ' '.join(options_list)
+
 # Function executes exactly like SubprocessCall but adds,
 # randomly arguments from JSC_MULTI_ARGS
 def SubprocessJSCCall(command, cwd=None, env=None, no_exit_code=None, test=None,
@@ -46,12 +55,7 @@ def SubprocessJSCCall(command, cwd=None, env=None, no_exit_code=None, test=None,
     # We check if options exists and if it does we use it, otherwise
     # we randomly select a set of options.
     if 'options' not in kwargs:
-        # Add the args randomly
-        options_list = random.sample(JSC_MULTI_ARGS,
-                                 k=random.randint(0, len(JSC_MULTI_ARGS)))
-                  
-        # Build options
-        options = ' '.join(options_list)
+        options = random_options()
     else:
         options = kwargs['options']
         
@@ -63,7 +67,8 @@ def SubprocessJSCCall(command, cwd=None, env=None, no_exit_code=None, test=None,
     command = formatter.vformat(command, (), mapping)
 
     issue = SubprocessCall(command, cwd, env, no_exit_code, test, timeout)
-    if issue:
+    # Non-issues get the options as well, for telemetry.
+    if issue is not None:
         issue['options'] = options
 
     # Call SubprocessCall
@@ -0,0 +1,108 @@
+# Copyright (c) 2021 Paulo Matos, Igalia S.L.
+#
+# Licensed under the BSD 3-Clause License
+# <LICENSE.rst or https://opensource.org/licenses/BSD-3-Clause>.
+# This file may not be copied, modified, or distributed except
+# according to those terms.
+
+import hashlib
+import logging
+import os
+import resource
+import socket
+import time
+
+from fuzzinator.config import as_path
+from fuzzinator.call import CallableDecorator
+
+from ..telemetry import get_writer
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryDecorator(CallableDecorator):
+    """
+    Decorator for SUT calls to log one compact record per execution, issue or
+    not, for offline analysis: the hash of the test, the options of the call,
+    the host, the exit code, wall and CPU time, the size of the output and
+    whether the call timed out.
+
+    Records are appended right after every call to a binary log shared by all
+    jobs and rotated by size (see :mod:`igalia.fuzzinator.telemetry` for
+    aggregating them).
+
+    **Mandatory parameter of the decorator:**
+
+      - ``path``: directory of the telemetry logs.
+
+    **Optional parameters of the decorator:**
+
+      - ``host``: name of the host executing the SUT (default: the local host
+        name).
+      - ``timeout``: timeout of the decorated call in seconds, calls running at
+        least this long are flagged as timed out.
+      - ``max_size``: size of a log file in bytes before starting a new one
+        (default: 64 MiB).
+
+    The decorator should directly wrap the call (be the first decorator) so
+    that the time of the other decorators is not accounted. CPU time covers
+    local child processes only.
+
+    **Example configuration snippet:**
+
+        .. code-block:: ini
+
+            [sut.foo]
+            call=igalia.fuzzinator.call.SubprocessJSCCall
+            call.decorate(0)=igalia.fuzzinator.call.TelemetryDecorator
+
+            [sut.foo.call]
+            command=./bin/foo {options} {test}
+            timeout=10
+
+            [sut.foo.call.decorate(0)]
+            path=${fuzzinator:work_dir}/telemetry
+            timeout=${sut.foo.call:timeout}
+    """
+
+    def decorator(self, path, host=None, timeout=None, max_size=None, **kwargs):
+        writer_kwargs = dict()
+        if max_size:
+            writer_kwargs['max_size'] = int(max_size)
+        path = as_path(path)
+        host = host or socket.gethostname()
+        timeout = float(timeout) if timeout else None
+
+        def wrapper(fn):
+            def logger_fn(*args, **kwargs):
+                start_cpu = resource.getrusage(resource.RUSAGE_CHILDREN)
+                start_wall = time.perf_counter()
+                issue = fn(*args, **kwargs)
+                wall_time = time.perf_counter() - start_wall
+                end_cpu = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+                try:
+                    test = kwargs['test']
+                    if isinstance(test, str) and os.path.isfile(test):
+                        with open(test, 'rb') as f:
+                            test = f.read()
+                    elif isinstance(test, str):
+                        test = test.encode('utf-8')
+                    cpu_time = (end_cpu.ru_utime - start_cpu.ru_utime) + (end_cpu.ru_stime - start_cpu.ru_stime)
+                    result = issue if issue is not None else dict()
+
+                    get_writer(path, **writer_kwargs).write(test_hash=hashlib.md5(test).digest(),
+                                                            wall_time=wall_time,
+                                                            cpu_time=cpu_time,
+                                                            output_size=len(result.get('stdout') or b'') + len(result.get('stderr') or b''),
+                                                            exit_code=result.get('exit_code'),
+                                                            timeout=timeout is not None and wall_time >= timeout,
+                                                            options=result.get('options', kwargs.get('options', '')),
+                                                            host=host)
+                except Exception as e:
+                    logger.warning('Failed to write telemetry', exc_info=e)
+
+                return issue
+
+            return logger_fn
+        return wrapper
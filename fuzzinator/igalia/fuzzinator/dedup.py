@@ -0,0 +1,269 @@
+# Copyright (c) 2021 Paulo Matos, Igalia S.L.
+#
+# Licensed under the BSD 3-Clause License
+# <LICENSE.rst or https://opensource.org/licenses/BSD-3-Clause>.
+# This file may not be copied, modified, or distributed except
+# according to those terms.
+"""Persistent filter of already executed (test, options) pairs."""
+
+# The filter is used by igalia.fuzzinator.call.JSCDedupDecorator. Its hit rate
+# can be reported and the filter reset with:
+# python -m igalia.fuzzinator.dedup [--reset] /path/to/dedup.bin
+
+import argparse
+import fcntl
+import hashlib
+import math
+import os
+import struct
+
+from contextlib import contextmanager
+
+MAGIC = b'JSCDDUP2'
+
+# Magic, number of bits, number of hashes, generation of the crash records,
+# number of items added, lookups, clean hits, crash hits and length of the
+# build id. The build id and the bits of the Bloom filter follow, then the
+# crash records, which are appended until the generation changes.
+HEADER = struct.Struct('<8sQIQQQQQH')
+
+# Key of a crashing execution and the number of times that it has been seen.
+CRASH = struct.Struct('<32sI')
+
+
+def normalize(test):
+    """
+    Normalize the line endings (as in template literals) and drop the
+    whitespace at the end of a test, any other whitespace may be significant.
+    """
+    return test.replace(b'\r\n', b'\n').rstrip()
+
+
+def test_key(test, options, build):
+    h = hashlib.sha256()
+    h.update(normalize(test))
+    # The order of the options does not matter.
+    h.update(b'\0' + ' '.join(sorted(options.split())).encode('utf-8'))
+    h.update(b'\0' + build.encode('utf-8'))
+    return h.digest()
+
+
+class DedupFilter(object):
+    """
+    Bloom filter of the keys of clean executions and exact counts of the keys
+    of crashing executions, persisted in ``path`` and shared by processes.
+
+    The filter is reset when the build changes or when more than ``capacity``
+    keys have been added, as its false positive rate would grow beyond
+    ``error_rate``. Lookups read the bits they need from the file. Hits and new
+    keys are collected in memory and merged into the file under a lock after
+    every ``sync_every`` lookups (so at most that many are lost when a process
+    exits without cleanup): only the changed bytes of the filter and the
+    header are written in place and the crash counts are appended.
+    """
+
+    def __init__(self, path, capacity=1000000, error_rate=0.001, sync_every=1):
+        self.path = path
+        self.capacity = capacity
+        self.bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        self.sync_every = sync_every
+        self.fd = None
+        self.build = None
+        self.header = None
+        # Crash counts read from the file and the offset where reading stopped.
+        self.crashes = dict()
+        self.crashes_end = None
+        self.added = set()
+        self.new_crashes = dict()
+        self.stats = dict(lookups=0, clean_hits=0, crash_hits=0)
+
+    @contextmanager
+    def locked(self, operation):
+        if self.fd is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def read_header(self):
+        data = os.pread(self.fd, HEADER.size, 0)
+        if len(data) < HEADER.size:
+            return None
+        magic, bits, hashes, generation, count, lookups, clean_hits, crash_hits, build_len = HEADER.unpack(data)
+        if magic != MAGIC or bits != self.bits or hashes != self.hashes:
+            return None
+        header = dict(build=os.pread(self.fd, build_len, HEADER.size).decode('utf-8'), generation=generation,
+                      count=count, lookups=lookups, clean_hits=clean_hits, crash_hits=crash_hits)
+        header['bits_offset'] = HEADER.size + build_len
+        header['crashes_offset'] = header['bits_offset'] + (self.bits + 7) // 8
+        if os.fstat(self.fd).st_size < header['crashes_offset']:
+            return None
+        return header
+
+    def write_header(self, header):
+        build = header['build'].encode('utf-8')
+        os.pwrite(self.fd, HEADER.pack(MAGIC, self.bits, self.hashes, header['generation'], header['count'], header['lookups'],
+                                       header['clean_hits'], header['crash_hits'], len(build)) + build, 0)
+
+    def reset(self, header, build):
+        """Rewrite the whole file with an empty filter for ``build``."""
+        build_len = len(build.encode('utf-8'))
+        header = dict(build=build, generation=header['generation'] + 1 if header else 0,
+                      count=0, lookups=0, clean_hits=0, crash_hits=0,
+                      bits_offset=HEADER.size + build_len,
+                      crashes_offset=HEADER.size + build_len + (self.bits + 7) // 8)
+        os.ftruncate(self.fd, 0)
+        os.ftruncate(self.fd, header['crashes_offset'])
+        self.write_header(header)
+        return header
+
+    def read_crashes(self, header):
+        """Read the crash records appended since the last call."""
+        end = os.fstat(self.fd).st_size
+        if self.crashes_end is None or self.crashes_end > end or header['generation'] != self.header['generation'] \
+                or header['build'] != self.header['build']:
+            self.crashes = dict()
+            self.crashes_end = header['crashes_offset']
+        size = end - self.crashes_end
+        data = os.pread(self.fd, size - size % CRASH.size, self.crashes_end)
+        for key, cnt in CRASH.iter_unpack(data):
+            self.crashes[key] = self.crashes.get(key, 0) + cnt
+        self.crashes_end += len(data)
+        self.header = header
+
+    def positions(self, key):
+        h1 = int.from_bytes(key[:8], 'little')
+        h2 = int.from_bytes(key[8:16], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def sync(self, build=None, reset=False):
+        """
+        Merge the pending changes into the file and read the new crash counts.
+        The filter is reset if ``build`` differs from the build of the file.
+        """
+        with self.locked(fcntl.LOCK_EX):
+            header = self.read_header()
+            if header is None or reset or (build is not None and header['build'] != build) \
+                    or header['count'] >= self.capacity:
+                header = self.reset(header, build if build is not None else header['build'] if header else '')
+
+            # Keys and statistics collected for another build are dropped.
+            if self.build == header['build']:
+                masks = dict()
+                for key in self.added:
+                    for pos in self.positions(key):
+                        masks[pos >> 3] = masks.get(pos >> 3, 0) | 1 << (pos & 7)
+                for index, mask in masks.items():
+                    byte = os.pread(self.fd, 1, header['bits_offset'] + index)[0]
+                    if byte | mask != byte:
+                        os.pwrite(self.fd, bytes([byte | mask]), header['bits_offset'] + index)
+                header['count'] += len(self.added)
+                for stat, cnt in self.stats.items():
+                    header[stat] += cnt
+
+                if self.new_crashes:
+                    self.read_crashes(header)
+                    # Repeated hits of the same crashes would grow the file
+                    # without bounds, the records are compacted then.
+                    records = (os.fstat(self.fd).st_size - header['crashes_offset']) // CRASH.size
+                    if records > 4 * len(self.crashes) + 1024:
+                        for key, cnt in self.new_crashes.items():
+                            self.crashes[key] = self.crashes.get(key, 0) + cnt
+                        header['generation'] += 1
+                        os.ftruncate(self.fd, header['crashes_offset'])
+                        crashes = self.crashes
+                    else:
+                        crashes = self.new_crashes
+                    os.pwrite(self.fd, b''.join(CRASH.pack(key, cnt) for key, cnt in crashes.items()),
+                              os.fstat(self.fd).st_size)
+                self.write_header(header)
+
+            self.read_crashes(header)
+
+        self.build = header['build']
+        self.added = set()
+        self.new_crashes = dict()
+        self.stats = dict(lookups=0, clean_hits=0, crash_hits=0)
+
+    def flush(self):
+        """Merge the pending changes into the file every ``sync_every`` lookups."""
+        if self.stats['lookups'] >= self.sync_every:
+            self.sync()
+
+    def report(self):
+        lookups = self.header['lookups'] + self.stats['lookups']
+        clean_hits = self.header['clean_hits'] + self.stats['clean_hits']
+        crash_hits = self.header['crash_hits'] + self.stats['crash_hits']
+        return '{lookups} lookups, {clean} clean hits, {crash} crash hits, {rate:.1%} hit rate, {count} clean keys, {crashes} crashing keys'.format(
+            lookups=lookups, clean=clean_hits, crash=crash_hits,
+            rate=(clean_hits + crash_hits) / lookups if lookups else 0, count=self.header['count'] + len(self.added),
+            crashes=len(set(self.crashes) | set(self.new_crashes)))
+
+    def lookup(self, key, build):
+        """
+        Return ``'crash'`` or ``'clean'`` if the key has been added with that
+        outcome for the build, ``None`` otherwise.
+        """
+        if self.header is None or build != self.build:
+            self.sync(build)
+
+        self.stats['lookups'] += 1
+        clean = False
+        with self.locked(fcntl.LOCK_SH):
+            header = self.read_header()
+            # The file may have been reset for another build since, it is
+            # reset again at the next sync.
+            if header is not None and header['build'] == self.build:
+                self.read_crashes(header)
+                clean = all(os.pread(self.fd, 1, header['bits_offset'] + (pos >> 3))[0] & (1 << (pos & 7))
+                            for pos in self.positions(key))
+
+        if key in self.crashes or key in self.new_crashes:
+            self.stats['crash_hits'] += 1
+            self.new_crashes[key] = self.new_crashes.get(key, 0) + 1
+            self.flush()
+            return 'crash'
+        if clean or key in self.added:
+            self.stats['clean_hits'] += 1
+            self.flush()
+            return 'clean'
+        return None
+
+    def add(self, key, crash=False):
+        if crash:
+            self.new_crashes[key] = self.new_crashes.get(key, 0) + 1
+        else:
+            self.added.add(key)
+        self.flush()
+
+
+filters = dict()
+
+
+def get_filter(path, **kwargs):
+    """Return the filter of the current process for ``path``."""
+    key = (os.getpid(), path)
+    if key not in filters:
+        filters[key] = DedupFilter(path, **kwargs)
+    return filters[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the hit rate of a dedup filter or reset it.')
+    parser.add_argument('--capacity', type=int, default=1000000, help='capacity of the filter (default: %(default)s)')
+    parser.add_argument('--error-rate', type=float, default=0.001, help='false positive rate of the filter (default: %(default)s)')
+    parser.add_argument('--reset', default=False, action='store_true', help='reset the filter')
+    parser.add_argument('path', help='file of the filter')
+    args = parser.parse_args()
+
+    dedup_filter = DedupFilter(args.path, capacity=args.capacity, error_rate=args.error_rate)
+    dedup_filter.sync(reset=args.reset)
+    print('{build}: {report}'.format(build=dedup_filter.build or '<none>', report=dedup_filter.report()))
+
+
+if __name__ == '__main__':
+    main()
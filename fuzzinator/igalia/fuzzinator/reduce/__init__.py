@@ -0,0 +1,9 @@
+# Copyright (c) 2021 Paulo Matos, Igalia S.L.
+#
+# Licensed under the BSD 3-Clause License
+# <LICENSE.rst or https://opensource.org/licenses/BSD-3-Clause>.
+# This file may not be copied, modified, or distributed except
+# according to those terms.
+
+from .cached_picireny import CachedPicireny
+from .reproducibility_decorator import ReproducibilityDecorator
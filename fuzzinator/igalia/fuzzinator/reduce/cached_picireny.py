@@ -0,0 +1,364 @@
+# Copyright (c) 2016-2018 Renata Hodovan, Akos Kiss.
+# Copyright (c) 2021 Paulo Matos, Igalia S.L.
+#
+# Licensed under the BSD 3-Clause License
+# <LICENSE.rst or https://opensource.org/licenses/BSD-3-Clause>.
+# This file may not be copied, modified, or distributed except
+# according to those terms.
+
+import chardet
+import copy
+import hashlib
+import importlib
+import json
+import logging
+import os
+import pickle
+import picire
+import picireny
+import shutil
+import sys
+import tempfile
+
+from fuzzinator.config import as_path
+from fuzzinator.reduce.picire_tester import PicireTester
+from picireny.antlr4 import parser_builder
+from picireny.antlr4.hdd_tree_builder import HDDErrorToken
+
+logger = logging.getLogger(__name__)
+
+# Name of the file listing the parsers generated into a cache entry.
+MANIFEST = 'parsers.json'
+
+
+def grammar_digest(input_format, antlr):
+    """
+    Compute the version of a parser cache entry: the hash of the grammar files,
+    the Picireny version (which decides the actions injected into the grammars)
+    and the ANTLR tool (which decides the generated code).
+    """
+    h = hashlib.sha256()
+    h.update(picireny.__version__.encode('utf-8'))
+    h.update(os.path.basename(antlr).encode('utf-8'))
+    for name in sorted(input_format):
+        h.update(name.encode('utf-8'))
+        for fn in input_format[name]['files']:
+            with open(fn, 'rb') as f:
+                h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def load_parsers(parser_dir, work_dir):
+    """
+    Register the parsers of a cache entry in Picireny's grammar cache as if they
+    had been generated into ``work_dir``, so that tree building in ``work_dir``
+    needs neither ANTLR nor a JVM.
+    """
+    with open(os.path.join(parser_dir, MANIFEST), 'r') as f:
+        manifest = json.load(f)
+
+    grammar_cache = parser_builder.grammar_cache.setdefault('python', {})
+    for entry in manifest:
+        module_dir = os.path.join(parser_dir, os.path.dirname(entry['grammars'][0]))
+        if module_dir not in sys.path:
+            sys.path.insert(0, module_dir)
+        classes = [getattr(importlib.import_module(name), name) for name in entry['classes']]
+        grammar_cache[tuple(os.path.join(work_dir, g) for g in entry['grammars'])] = classes
+
+
+def save_parsers(build_dir):
+    """
+    Write the manifest of the parsers that Picireny generated into
+    ``build_dir``. Returns ``False`` if no parsers were found there.
+    """
+    manifest = []
+    for grammars, classes in parser_builder.grammar_cache.get('python', {}).items():
+        if all(g.startswith(build_dir + os.sep) for g in grammars):
+            manifest.append({
+                'grammars': [os.path.relpath(g, build_dir) for g in grammars],
+                'classes': [cls.__name__ for cls in classes],
+            })
+
+    if not manifest:
+        logger.warning('No parsers generated by Picireny were found in %s, they cannot be cached.', build_dir)
+        return False
+
+    with open(os.path.join(build_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+    return True
+
+
+def verify_parsers(build_dir, check_dir, build_tree, sample):
+    """
+    Check that the parsers of a cache entry in ``build_dir`` load like in a
+    later reduction and parse ``sample`` without syntax errors. Returns
+    ``False`` otherwise, the entry must not be published then.
+    """
+    try:
+        load_parsers(build_dir, check_dir)
+        hdd_tree = build_tree(check_dir, sample, True)
+    except Exception as e:
+        logger.warning('Parsers generated into %s failed to parse the sample test.', build_dir, exc_info=e)
+        return False
+
+    errors = []
+    hdd_tree.traverse(lambda node: errors.append(node) if isinstance(node, HDDErrorToken) else None)
+    if errors:
+        logger.warning('Parsers generated into %s found %d syntax errors in the sample test.', build_dir, len(errors))
+        return False
+    return True
+
+
+def prune_trees(tree_dir, size):
+    """
+    Keep only the ``size`` most recently used HDD trees in ``tree_dir``.
+    """
+    trees = []
+    for entry in os.scandir(tree_dir):
+        if entry.name.endswith('.pickle'):
+            try:
+                trees.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                pass
+
+    for _, path in sorted(trees, reverse=True)[size:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def CachedPicireny(sut_call, sut_call_kwargs, listener, ident, issue, work_dir,
+                   parser_dir, sample=None, tree_cache=True, tree_cache_size=1000,
+                   hddmin=None, parallel=False, combine_loops=False,
+                   split_method='zeller', subset_first=True, subset_iterator='forward', complement_iterator='forward',
+                   jobs=os.cpu_count(), max_utilization=100, encoding=None,
+                   antlr=None, format=None, grammar=None, start=None, replacements=None,
+                   hdd_star=True, flatten_recursion=False, squeeze_tree=True, skip_unremovable=True, skip_whitespace=False,
+                   build_hidden_tokens=False, granularity=2, cache_class='ContentCache', cleanup=True,
+                   **kwargs):
+    """
+    Test case reducer based on the Picireny Hierarchical Delta Debugging
+    Framework that reuses the generated parsers and the parse trees across
+    reduce jobs.
+
+    The parsers of the input format are generated for the Python target once
+    and stored in ``parser_dir`` in a directory named after the hash of the
+    grammar files. Subsequent reductions load the parsers from there and parse
+    in-process, without invoking the ANTLR tool, ``javac`` or ``java``. The
+    first reduction after a grammar change rebuilds the parsers. Newly built
+    parsers are only stored if they parse a sample test without syntax errors.
+
+    The grammars must be written for the Python target, i.e., their actions and
+    semantic predicates must be Python code.
+
+    **Mandatory parameters of the reducer:**
+
+      - ``parser_dir``: directory to store the generated parsers in.
+      - Either ``format`` or ``grammar`` and ``start`` must be defined.
+
+    **Optional parameters of the reducer:**
+
+      - ``sample``: path to the test that newly built parsers are checked with;
+        defaults to the test being reduced.
+      - ``tree_cache``: if true, store the HDD tree of every reduced test next
+        to the parsers and reuse it when a test with the same content is
+        reduced again (e.g., a duplicate issue); defaults to ``True``.
+      - ``tree_cache_size``: number of HDD trees to keep, the least recently
+        used ones are removed; defaults to 1000.
+      - ``hddmin``, ``parallel``, ``combine_loops``, ``split_method``, ``subset_first``,
+        ``subset_iterator``, ``complement_iterator``, ``jobs``, ``max_utilization``, ``encoding``,
+        ``antlr``, ``format``, ``grammar``, ``start``, ``replacements``,
+        ``hdd_star``, ``flatten_recursion``, ``squeeze_tree``, ``skip_unremovable``, ``skip_whitespace``,
+        ``build_hidden_tokens``, ``granularity``, ``cache_class``, ``cleanup``:
+        as for :func:`fuzzinator.reduce.Picireny` (``lang`` is not supported,
+        parsers are always generated for the Python target).
+
+    **Example configuration snippet:**
+
+        .. code-block:: ini
+
+            [sut.foo]
+            #call=...
+            reduce=igalia.fuzzinator.reduce.CachedPicireny
+
+            [sut.foo.reduce]
+            parser_dir=${fuzzinator:work_dir}/parsers
+            sample=/home/alice/grammars-v4/examples/sample.js
+            grammar=["/home/alice/grammars-v4/ECMAScript.g4"]
+            start=program
+    """
+
+    def eval_arg(arg):
+        return eval(arg) if isinstance(arg, str) else arg
+
+    logging.getLogger('picireny').setLevel(logger.level)
+
+    antlr = picireny.process_antlr4_path(antlr)
+    if antlr is None:
+        return None, []
+
+    input_format, start = picireny.process_antlr4_format(format=format, grammar=json.loads(grammar), start=start, replacements=replacements)
+
+    if not (input_format and start):
+        logger.warning('Processing the arguments of picireny failed.')
+        return None, []
+
+    src = issue['test']
+    file_name = issue.get('filename', 'test')
+    if sample:
+        with open(as_path(sample), 'rb') as f:
+            sample_src = f.read()
+    else:
+        sample_src = src
+
+    hddmin = picireny.cli.args_hdd_choices[hddmin if hddmin else 'full']
+    parallel = eval_arg(parallel)
+    combine_loops = eval_arg(combine_loops)
+    split_method = getattr(picire.config_splitters, split_method)
+    subset_first = eval_arg(subset_first)
+    subset_iterator = getattr(picire.config_iterators, subset_iterator)
+    complement_iterator = getattr(picire.config_iterators, complement_iterator)
+    jobs = 1 if not parallel else eval_arg(jobs)
+    max_utilization = eval_arg(max_utilization)
+    encoding = encoding or chardet.detect(src)['encoding'] or 'utf-8'
+    hdd_star = eval_arg(hdd_star)
+    flatten_recursion = eval_arg(flatten_recursion)
+    squeeze_tree = eval_arg(squeeze_tree)
+    skip_unremovable = eval_arg(skip_unremovable)
+    skip_whitespace = eval_arg(skip_whitespace)
+    build_hidden_tokens = eval_arg(build_hidden_tokens)
+    granularity = eval_arg(granularity) if granularity != 'inf' else float('inf')
+    cleanup = eval_arg(cleanup)
+    tree_cache = eval_arg(tree_cache)
+    tree_cache_size = eval_arg(tree_cache_size)
+
+    cache_class = getattr(picire, cache_class)
+    if parallel:
+        cache_class = picire.shared_cache_decorator(cache_class)
+
+    # Choose the reducer class that will be used and its configuration.
+    reduce_config = {'split': split_method}
+    if not parallel:
+        reduce_class = picire.LightDD
+        reduce_config['subset_iterator'] = subset_iterator
+        reduce_config['complement_iterator'] = complement_iterator
+        reduce_config['subset_first'] = subset_first
+    else:
+        reduce_config['proc_num'] = jobs
+        reduce_config['max_utilization'] = max_utilization
+
+        if combine_loops:
+            reduce_class = picire.CombinedParallelDD
+            reduce_config['config_iterator'] = picire.CombinedIterator(subset_first, subset_iterator, complement_iterator)
+        else:
+            reduce_class = picire.ParallelDD
+            reduce_config['subset_iterator'] = subset_iterator
+            reduce_config['complement_iterator'] = complement_iterator
+            reduce_config['subset_first'] = subset_first
+
+    issues = dict()
+    tester_config = dict(
+        sut_call=sut_call,
+        sut_call_kwargs=sut_call_kwargs,
+        enc=encoding,
+        expected=issue['id'],
+        listener=listener,
+        ident=ident,
+        issues=issues
+    )
+
+    parser_root = as_path(parser_dir)
+    digest = grammar_digest(input_format, antlr)
+    parser_dir = os.path.join(parser_root, digest)
+
+    tree_key = hashlib.sha256(json.dumps([digest, input_format, start, encoding, build_hidden_tokens], sort_keys=True).encode('utf-8') + src).hexdigest()
+    tree_dir = os.path.join(parser_root, 'trees', digest)
+    tree_file = os.path.join(tree_dir, tree_key + '.pickle')
+
+    def build_tree(out, src, cleanup):
+        # Picireny rewrites the grammar paths of the input format, so every
+        # build gets its own copy.
+        return picireny.build_with_antlr4(input=file_name,
+                                          src=src,
+                                          encoding=encoding,
+                                          out=out,
+                                          input_format=copy.deepcopy(input_format),
+                                          start=start,
+                                          antlr=antlr,
+                                          lang='python',
+                                          build_hidden_tokens=build_hidden_tokens,
+                                          cleanup=cleanup)
+
+    try:
+        hdd_tree = None
+        if tree_cache and os.path.exists(tree_file):
+            try:
+                with open(tree_file, 'rb') as f:
+                    hdd_tree = pickle.load(f)
+                # Mark the tree as recently used for pruning.
+                os.utime(tree_file)
+                logger.debug('HDD tree of %s is loaded from %s.', file_name, tree_file)
+            except Exception as e:
+                logger.warning('Failed to load cached HDD tree from %s', tree_file, exc_info=e)
+
+        if hdd_tree is None:
+            if os.path.exists(os.path.join(parser_dir, MANIFEST)):
+                load_parsers(parser_dir, work_dir)
+                hdd_tree = build_tree(work_dir, src, cleanup)
+            else:
+                # Generate the parsers into a private directory and publish it
+                # atomically, concurrent reduce jobs may be doing the same.
+                logger.info('Building parsers for grammar version %s.', digest)
+                os.makedirs(parser_root, exist_ok=True)
+                build_dir = tempfile.mkdtemp(prefix=digest + '-', dir=parser_root)
+                hdd_tree = build_tree(build_dir, src, False)
+                check_dir = tempfile.mkdtemp(prefix=digest + '-check-', dir=parser_root)
+                try:
+                    published = save_parsers(build_dir) and verify_parsers(build_dir, check_dir, build_tree, sample_src)
+                finally:
+                    shutil.rmtree(check_dir, ignore_errors=True)
+                if not published:
+                    shutil.rmtree(build_dir, ignore_errors=True)
+                else:
+                    try:
+                        os.rename(build_dir, parser_dir)
+                    except OSError:
+                        shutil.rmtree(build_dir, ignore_errors=True)
+
+            if tree_cache:
+                try:
+                    os.makedirs(tree_dir, exist_ok=True)
+                    with tempfile.NamedTemporaryFile(dir=tree_dir, suffix='.tmp', delete=False) as f:
+                        pickle.dump(hdd_tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(f.name, tree_file)
+                    prune_trees(tree_dir, tree_cache_size)
+                except Exception as e:
+                    logger.warning('Failed to cache HDD tree in %s', tree_file, exc_info=e)
+
+        reduced_file = picireny.reduce(hdd_tree=hdd_tree,
+                                       reduce_class=reduce_class,
+                                       reduce_config=reduce_config,
+                                       tester_class=PicireTester,
+                                       tester_config=tester_config,
+                                       input=file_name,
+                                       encoding=encoding,
+                                       out=work_dir,
+                                       hddmin=hddmin,
+                                       hdd_star=hdd_star,
+                                       flatten_recursion=flatten_recursion,
+                                       squeeze_tree=squeeze_tree,
+                                       skip_unremovable=skip_unremovable,
+                                       skip_whitespace=skip_whitespace,
+                                       unparse_with_whitespace=not build_hidden_tokens,
+                                       granularity=granularity,
+                                       cache_class=cache_class,
+                                       cleanup=cleanup)
+    except Exception as e:
+        logger.warning('Exception in picireny', exc_info=e)
+        return None, list(issues.values())
+
+    with open(reduced_file, 'rb') as f:
+        src = f.read()
+
+    return src, list(issues.values())
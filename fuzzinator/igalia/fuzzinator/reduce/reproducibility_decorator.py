@@ -0,0 +1,187 @@
+# Copyright (c) 2021 Paulo Matos, Igalia S.L.
+#
+# Licensed under the BSD 3-Clause License
+# <LICENSE.rst or https://opensource.org/licenses/BSD-3-Clause>.
+# This file may not be copied, modified, or distributed except
+# according to those terms.
+
+import logging
+import math
+import os
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from fuzzinator.call import CallableDecorator
+from fuzzinator.mongo_driver import MongoDriver
+
+logger = logging.getLogger(__name__)
+
+
+class RepeatedCall(object):
+    """
+    Wrapper of a ``sut_call`` that repeats the call up to ``repeat`` times
+    until the issue with ``expected`` id reproduces.
+    """
+
+    def __init__(self, sut_call, expected, repeat):
+        self.sut_call = sut_call
+        self.expected = expected
+        self.repeat = repeat
+
+    def __enter__(self):
+        self.sut_call.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self.sut_call.__exit__(*exc)
+
+    def __call__(self, **kwargs):
+        issue = None
+        for _ in range(self.repeat):
+            issue = self.sut_call(**kwargs)
+            if issue is not None and issue.get('id') == self.expected:
+                break
+        return issue
+
+
+class ReproducibilityDecorator(CallableDecorator):
+    """
+    Decorator for reducers of SUTs with nondeterministic issues: scores how
+    reliably the issue reproduces once, before the reduction starts, and
+    repeats the interestingness test of flaky issues during reduction.
+
+      - The test of the issue is run up to ``runs`` times in parallel with the
+        ``sut_call`` of the reducer, each run with its own test file and with
+        the ``'options'`` of the issue (if any). Scoring stops as soon as the
+        issue is known to be reliable, flaky or never to reproduce; the runs
+        in progress are waited for.
+      - The number of runs that reproduced the issue and the number of
+        completed runs are stored in the ``'reproduction_hits'`` and
+        ``'reproduction_runs'`` properties of the issue, both in the database
+        and in the issue passed to the reducer.
+      - Issues that never reproduce are not reduced.
+      - Issues that reproduced in less than ``threshold`` of the runs are
+        considered flaky and the interestingness test is repeated up to
+        ``repeat`` times until the issue reproduces. Reliable issues are tested
+        only once.
+
+    Issues that have already been scored are not scored again, unless they
+    never reproduced (reduction only starts if the issue has been validated
+    since).
+
+    **Mandatory parameter of the decorator:**
+
+      - ``db_uri``: URI of the database of the issues.
+
+    **Optional parameters of the decorator:**
+
+      - ``db_server_selection_timeout``: server selection timeout of the
+        database in milliseconds.
+      - ``runs``: number of runs to score reproducibility with (default: 8).
+      - ``jobs``: number of parallel runs while scoring (default: ``runs``).
+      - ``threshold``: ratio of reproducing runs below which an issue is
+        considered flaky (default: 1.0).
+      - ``repeat``: maximum number of runs of the interestingness test of
+        flaky issues (default: 3).
+
+    **Example configuration snippet:**
+
+        .. code-block:: ini
+
+            [sut.foo]
+            reduce=fuzzinator.reduce.Picire
+            reduce.decorate(0)=igalia.fuzzinator.reduce.ReproducibilityDecorator
+
+            [sut.foo.reduce.decorate(0)]
+            db_uri=${fuzzinator:db_uri}
+            runs=10
+            threshold=0.9
+            repeat=5
+    """
+
+    def decorator(self, db_uri, db_server_selection_timeout=None, runs=None, jobs=None, threshold=None, repeat=None, **kwargs):
+        runs = int(runs) if runs else 8
+        jobs = int(jobs) if jobs else runs
+        threshold = float(threshold) if threshold else 1.0
+        repeat = int(repeat) if repeat else 3
+
+        # The outcome is decided once enough runs reproduced the issue to make
+        # it reliable or enough runs missed it to make it flaky.
+        reliable_hits = max(1, math.ceil(threshold * runs))
+        flaky_misses = runs - reliable_hits + 1
+
+        def store(issue, hits, completed):
+            issue['reproduction_hits'] = hits
+            issue['reproduction_runs'] = completed
+            if db_server_selection_timeout:
+                db = MongoDriver(db_uri, int(db_server_selection_timeout))
+            else:
+                db = MongoDriver(db_uri)
+            db.update_issue(issue, {'reproduction_hits': hits, 'reproduction_runs': completed})
+
+        def wrapper(fn):
+            def reducer(*args, sut_call, sut_call_kwargs, listener, issue, work_dir, **kwargs):
+                new_issues = dict()
+
+                if not issue.get('reproduction_hits'):
+                    call_kwargs = dict(sut_call_kwargs)
+                    if 'options' in issue:
+                        call_kwargs['options'] = issue['options']
+                    # Every parallel run needs its own test file.
+                    ext = os.path.splitext(issue.get('filename', ''))[1]
+                    test_dir = os.path.join(work_dir, 'reproducibility')
+
+                    def run(i):
+                        try:
+                            return sut_call(test=issue['test'], filename=os.path.join(test_dir, '{i}{ext}'.format(i=i, ext=ext)), **call_kwargs)
+                        except Exception as e:
+                            logger.warning('Reproducing issue %r failed.', issue['id'], exc_info=e)
+                            return None
+
+                    results = []
+
+                    def count(futures):
+                        for future in futures:
+                            if not future.cancelled():
+                                result = future.result()
+                                results.append(result is not None and result.get('id') == issue['id'])
+                                if result is not None and not results[-1] and result.get('id') not in new_issues:
+                                    result['test'] = issue['test']
+                                    new_issues[result.get('id')] = result
+                        return results.count(True), results.count(False)
+
+                    with sut_call:
+                        executor = ThreadPoolExecutor(max_workers=jobs)
+                        pending = {executor.submit(run, i) for i in range(runs)}
+                        try:
+                            while pending:
+                                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                                hits, misses = count(done)
+                                if hits >= reliable_hits or (hits and misses >= flaky_misses) or misses == runs:
+                                    break
+                        finally:
+                            # The reduction must not start while runs are still
+                            # in progress, their outcome is counted as well.
+                            executor.shutdown(wait=True, cancel_futures=True)
+                    hits, misses = count(pending)
+
+                    logger.debug('Issue %r reproduced %d times out of %d.', issue['id'], hits, hits + misses)
+                    try:
+                        store(issue, hits, hits + misses)
+                        listener.update_issue(issue=issue)
+                    except Exception as e:
+                        logger.warning('Failed to store the reproducibility of issue %r.', issue['id'], exc_info=e)
+
+                    if not hits:
+                        logger.info('Issue %r does not reproduce, it is not reduced.', issue['id'])
+                        return None, list(new_issues.values())
+
+                if issue['reproduction_hits'] < threshold * issue['reproduction_runs']:
+                    sut_call = RepeatedCall(sut_call, issue['id'], repeat)
+
+                reduced_src, reduced_issues = fn(*args, sut_call=sut_call, sut_call_kwargs=sut_call_kwargs, listener=listener,
+                                                 issue=issue, work_dir=work_dir, **kwargs)
+                return reduced_src, list(new_issues.values()) + list(reduced_issues)
+
+            return reducer
+        return wrapper
@@ -0,0 +1,149 @@
+# Copyright (c) 2021 Paulo Matos, Igalia S.L.
+#
+# Licensed under the BSD 3-Clause License
+# <LICENSE.rst or https://opensource.org/licenses/BSD-3-Clause>.
+# This file may not be copied, modified, or distributed except
+# according to those terms.
+"""Per-execution telemetry log of SUT calls."""
+
+# Records are appended to a shared, size-rotated binary log by TelemetryWriter
+# (see igalia.fuzzinator.call.TelemetryDecorator) and aggregated offline with:
+# python -m igalia.fuzzinator.telemetry --group-by flag /path/to/telemetry
+
+import argparse
+import collections
+import datetime
+import fcntl
+import glob
+import os
+import struct
+import time
+
+# Fixed part of a record: test hash (MD5), timestamp, wall time, CPU time,
+# output size, exit code, flags, length of the options and of the host name.
+# The options and the host name follow as UTF-8.
+RECORD = struct.Struct('<16sdffIiBHH')
+
+EXIT_CODE_NONE = -2 ** 31
+
+FLAG_TIMEOUT = 1
+
+Record = collections.namedtuple('Record', ['test_hash', 'timestamp', 'wall_time', 'cpu_time', 'output_size',
+                                           'exit_code', 'timeout', 'options', 'host'])
+
+
+class TelemetryWriter(object):
+    """
+    Appends every telemetry record with a single write to ``telemetry.bin`` in
+    ``path``, shared by all processes, so that nothing is lost when a job
+    process exits without cleanup. The file is opened with ``O_APPEND``, so the
+    records of concurrent writers do not interleave. Once the file grows beyond
+    ``max_size`` bytes, it is renamed to ``telemetry-<time>-<pid>.bin`` and a
+    new one is started.
+    """
+
+    def __init__(self, path, max_size=64 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.file_name = os.path.join(path, 'telemetry.bin')
+        self.fd = None
+
+    def open(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.fd = os.open(self.file_name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def write(self, test_hash, wall_time, cpu_time, output_size, exit_code, timeout, options, host):
+        options = options.encode('utf-8')
+        host = host.encode('utf-8')
+        record = RECORD.pack(test_hash, time.time(), wall_time, cpu_time, min(output_size, 2 ** 32 - 1),
+                             EXIT_CODE_NONE if exit_code is None else exit_code,
+                             FLAG_TIMEOUT if timeout else 0, len(options), len(host)) + options + host
+
+        if self.fd is None:
+            self.open()
+        os.write(self.fd, record)
+
+        if os.fstat(self.fd).st_size >= self.max_size:
+            self.rotate()
+
+    def rotate(self):
+        # The file may have been rotated by another process already, in that
+        # case only the new one is opened.
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(self.file_name) and os.path.samestat(os.stat(self.file_name), os.fstat(self.fd)):
+                os.rename(self.file_name, os.path.join(self.path, 'telemetry-{time:%Y%m%d%H%M%S%f}-{pid}.bin'.format(
+                    time=datetime.datetime.now(), pid=os.getpid())))
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+        self.open()
+
+
+writers = dict()
+
+
+def get_writer(path, **kwargs):
+    """Return the writer of the current process for ``path``."""
+    key = (os.getpid(), path)
+    if key not in writers:
+        writers[key] = TelemetryWriter(path, **kwargs)
+    return writers[key]
+
+
+def read_records(file_name):
+    with open(file_name, 'rb') as f:
+        data = f.read()
+
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        test_hash, timestamp, wall_time, cpu_time, output_size, exit_code, flags, options_len, host_len = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        options = data[offset:offset + options_len].decode('utf-8')
+        offset += options_len
+        host = data[offset:offset + host_len].decode('utf-8')
+        offset += host_len
+        yield Record(test_hash.hex(), timestamp, wall_time, cpu_time, output_size,
+                     None if exit_code == EXIT_CODE_NONE else exit_code,
+                     bool(flags & FLAG_TIMEOUT), options, host)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate the telemetry logs of SUT calls.')
+    parser.add_argument('--group-by', choices=['options', 'flag', 'host', 'exit_code'], default='flag',
+                        help='aggregation key; flag counts every option separately (default: %(default)s)')
+    parser.add_argument('--since', metavar='EPOCH', type=float, default=0,
+                        help='ignore records older than this timestamp')
+    parser.add_argument('path', help='directory of the telemetry logs')
+    args = parser.parse_args()
+
+    stats = collections.defaultdict(lambda: dict(runs=0, tests=set(), wall=0.0, cpu=0.0, output=0, timeouts=0, failures=0))
+    for file_name in sorted(glob.glob(os.path.join(args.path, 'telemetry*.bin'))):
+        for record in read_records(file_name):
+            if record.timestamp < args.since:
+                continue
+
+            if args.group_by == 'flag':
+                keys = record.options.split() or ['<none>']
+            else:
+                keys = [getattr(record, args.group_by)]
+
+            for key in keys:
+                s = stats[key]
+                s['runs'] += 1
+                s['tests'].add(record.test_hash)
+                s['wall'] += record.wall_time
+                s['cpu'] += record.cpu_time
+                s['output'] += record.output_size
+                s['timeouts'] += record.timeout
+                s['failures'] += record.exit_code not in (0, None)
+
+    print('{:<60} {:>9} {:>9} {:>12} {:>12} {:>12} {:>9} {:>9}'.format(args.group_by, 'runs', 'tests', 'wall (s)', 'cpu (s)',
+                                                                       'output (B)', 'timeouts', 'failures'))
+    for key, s in sorted(stats.items(), key=lambda item: -item[1]['cpu']):
+        print('{:<60} {:>9} {:>9} {:>12.1f} {:>12.1f} {:>12} {:>9} {:>9}'.format(str(key)[:60], s['runs'], len(s['tests']), s['wall'], s['cpu'],
+                                                                              s['output'], s['timeouts'], s['failures']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+// Exercises the semantic predicates of ECMAScript.g4: restricted productions,
+// automatic semicolon insertion, regex literals, getters and setters.
+var o = {
+    get value() { return this.v },
+    set value(v) { this.v = v }
+}
+var re = /ab+c/g
+var half = o.value / 2
+function f(x) {
+    if (!x)
+        return
+    x++
+    /* a multi line
+       comment */ x--
+    do { x = x - 1 } while (x > 0)
+    return re.test('abbc') ? 1 : 0
+}
+label: for (var i = 0; i < 2; i++) {
+    if (i) break label
+    continue
+}
+f(1)
@@ -0,0 +1,373 @@
+# Copyright (c) 2021 Paulo Matos, Igalia S.L.
+#
+# Licensed under the BSD 3-Clause License
+# <LICENSE.rst or https://opensource.org/licenses/BSD-3-Clause>.
+# This file may not be copied, modified, or distributed except
+# according to those terms.
+"""Deploy a JSC build to remote boards by sending only changed blocks."""
+
+# Run it like this from the WebKit checkout after a (cross-)build:
+# python deploy-jsc.py --revision $(git rev-parse HEAD) --build-dir WebKitBuild/Debug \
+#     --remote-dir /home/pi/jsc32-fuzz pi@rpi-master:22 pi@rpi-2:22
+#
+# Every file is split into content-defined blocks identified by their SHA-256:
+# block boundaries are placed where a rolling (gear) hash of the last bytes
+# matches a pattern, so code inserted into or removed from a rebuilt binary
+# only changes the blocks around the edit instead of shifting all the ones
+# after it. A board keeps the block list of its current build in MANIFEST.json,
+# so only the blocks that it does not have yet are sent over SSH. Only the files
+# whose SHA-256 differs from that manifest are chunked again (vectorized with
+# numpy, if it is installed, which is far faster). The new build
+# is assembled next to the current one by a small Python script run on the
+# board and then swapped in atomically by renaming the `current` symlink.
+#
+# Remote layout:
+#   <remote-dir>/current -> releases/<revision>-<content hash>
+#   <remote-dir>/releases/<revision>-<content hash>/{MANIFEST.json,bin/jsc,lib/...}
+#
+# With --check, nothing is deployed; the script only verifies that every board
+# runs the same build (revision and content) of the given revision.
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import posixpath
+import stat
+import sys
+import threading
+
+import paramiko
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Minimum, average and maximum size of the blocks.
+MIN_BLOCK_SIZE = 16 * 1024
+AVG_BLOCK_SIZE = 64 * 1024
+MAX_BLOCK_SIZE = 256 * 1024
+
+# Number of the last bytes that the rolling hash depends on.
+WINDOW_SIZE = 64
+
+# Identifies the chunking parameters in the manifest, blocks of builds chunked
+# differently are not reused.
+CHUNKING = 'gear{window}-{min}-{avg}-{max}'.format(window=WINDOW_SIZE, min=MIN_BLOCK_SIZE, avg=AVG_BLOCK_SIZE, max=MAX_BLOCK_SIZE)
+
+# Random but fixed values of the bytes for the gear hash.
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'little') for i in range(256)]
+
+# A boundary is placed after the bytes where the top bits of the hash of the
+# last WINDOW_SIZE bytes are all zero.
+BOUNDARY_MASK = (AVG_BLOCK_SIZE - 1) << (64 - (AVG_BLOCK_SIZE - 1).bit_length())
+
+# Bytes hashed at once by the vectorized chunker.
+CHUNK_BATCH_SIZE = 4 * 1024 * 1024
+
+# Assembles the files of a new build on the board. Reads a JSON plan line from
+# stdin followed by the literal blocks, in the order they are referred to.
+ASSEMBLER = r'''
+import hashlib, json, os, shutil, sys
+inp = sys.stdin.buffer
+plan = json.loads(inp.readline())
+root, dest = plan['root'], plan['dest']
+shutil.rmtree(dest, ignore_errors=True)
+for f in plan['files']:
+    path = os.path.join(dest, f['name'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    h = hashlib.sha256()
+    with open(path, 'wb') as out:
+        for op in f['blocks']:
+            if op[0] == 'copy':
+                out.flush()
+                with open(os.path.join(root, op[1]), 'rb') as src:
+                    src.seek(op[2])
+                    data = src.read(op[3])
+            else:
+                data = inp.read(op[1])
+            h.update(data)
+            out.write(data)
+    if h.hexdigest() != f['sha256']:
+        sys.exit('checksum mismatch: ' + f['name'])
+    os.chmod(path, f['mode'])
+with open(os.path.join(dest, 'MANIFEST.json'), 'w') as out:
+    json.dump(plan['manifest'], out)
+'''
+
+
+def parse_board(board):
+    """Split user@host[:port] into its parts."""
+    username, _, hostport = board.rpartition('@')
+    hostname, _, port = hostport.partition(':')
+    return username or None, hostname, int(port) if port else 22
+
+
+def connect(board):
+    username, hostname, port = parse_board(board)
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.WarningPolicy())
+    client.connect(hostname, port=port, username=username, banner_timeout=200)
+    return client
+
+
+def run(client, cmd, stdin_data=None):
+    stdin, stdout, stderr = client.exec_command(cmd)
+
+    # Drain the output while sending the input, the remote command may stop
+    # reading its input or exit early with a full output buffer.
+    output = dict()
+    readers = [threading.Thread(target=lambda name, f: output.update({name: f.read()}), args=(name, f))
+               for name, f in [('out', stdout), ('err', stderr)]]
+    for reader in readers:
+        reader.start()
+
+    if stdin_data is not None:
+        try:
+            for data in stdin_data:
+                if stdin.channel.exit_status_ready():
+                    break
+                stdin.write(data)
+            stdin.channel.shutdown_write()
+        except OSError:
+            # The remote command has exited, its status tells why.
+            pass
+
+    for reader in readers:
+        reader.join()
+    if stdout.channel.recv_exit_status() != 0:
+        raise RuntimeError('{cmd} failed on remote: {err}'.format(cmd=cmd.splitlines()[0], err=output['err'].decode('utf-8', errors='ignore')))
+    return output['out']
+
+
+def boundaries(data):
+    """
+    Return the sorted positions of data after which a block may end, using
+    numpy to hash all the windows of a batch at once.
+    """
+    gear = numpy.array(GEAR, dtype=numpy.uint64)
+    mask = numpy.uint64(BOUNDARY_MASK)
+    result = []
+    for batch in range(0, len(data), CHUNK_BATCH_SIZE):
+        # Every window of the batch needs the bytes before it.
+        offset = max(0, batch - WINDOW_SIZE + 1)
+        h = gear[numpy.frombuffer(data, dtype=numpy.uint8, count=min(len(data), batch + CHUNK_BATCH_SIZE) - offset, offset=offset)]
+        # The hash of a window is the sum of the shifted hashes of its two
+        # halves, so log2(WINDOW_SIZE) steps compute the hash of every window.
+        width = 1
+        while width < WINDOW_SIZE:
+            h[width:] += h[:-width] << numpy.uint64(width)
+            width *= 2
+        positions = numpy.flatnonzero((h & mask) == 0) + offset
+        result.append(positions[positions >= batch])
+    return numpy.concatenate(result) if result else numpy.array([], dtype=numpy.int64)
+
+
+def chunk(data):
+    """Split data into content-defined blocks, yield their offsets and sizes."""
+    length = len(data)
+    candidates = boundaries(data) if numpy is not None else None
+    start = 0
+    while start < length:
+        end = min(start + MAX_BLOCK_SIZE, length)
+        cut = end
+        # No boundary is looked for in the first bytes of a block.
+        if candidates is not None:
+            i = numpy.searchsorted(candidates, start + MIN_BLOCK_SIZE)
+            if i < len(candidates) and candidates[i] < end:
+                cut = int(candidates[i]) + 1
+        else:
+            gear, mask, h = GEAR, BOUNDARY_MASK, 0
+            for i, byte in enumerate(data[start + MIN_BLOCK_SIZE - WINDOW_SIZE + 1:end], start + MIN_BLOCK_SIZE - WINDOW_SIZE + 1):
+                h = ((h << 1) + gear[byte]) & 0xffffffffffffffff
+                if i >= start + MIN_BLOCK_SIZE and not h & mask:
+                    cut = i + 1
+                    break
+        yield start, cut - start
+        start = cut
+
+
+def build_manifest(build_dir, patterns, revision):
+    """
+    Describe every file of the local build. The block lists are computed by
+    add_blocks() only for the files that a board does not have yet.
+    """
+    files = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(os.path.join(build_dir, pattern))):
+            if not os.path.isfile(path):
+                continue
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for data in iter(lambda: f.read(CHUNK_BATCH_SIZE), b''):
+                    h.update(data)
+            files.append({
+                'name': os.path.relpath(path, build_dir),
+                'mode': stat.S_IMODE(os.stat(path).st_mode),
+                'sha256': h.hexdigest(),
+                'blocks': None,
+            })
+    # Rebuilds of the same revision get their own release directory, so the
+    # current one is never overwritten in place.
+    digest = hashlib.sha256(''.join(f['name'] + f['sha256'] for f in files).encode('utf-8')).hexdigest()
+    release = '{revision}-{digest}'.format(revision=revision, digest=digest[:12])
+    return {'revision': revision, 'release': release, 'chunking': CHUNKING, 'files': files}
+
+
+def add_blocks(manifest, build_dir, old_manifest):
+    """
+    Complete the block lists of the manifest. Files unchanged since the old
+    manifest keep their blocks, only the others are chunked.
+    """
+    known = dict()
+    if old_manifest and old_manifest.get('chunking') == CHUNKING:
+        known = {f['sha256']: f['blocks'] for f in old_manifest['files']}
+
+    for f in manifest['files']:
+        if f['blocks'] is None:
+            if f['sha256'] in known:
+                f['blocks'] = known[f['sha256']]
+            else:
+                with open(os.path.join(build_dir, f['name']), 'rb') as fd:
+                    data = fd.read()
+                f['blocks'] = [[hashlib.sha256(data[offset:offset + size]).hexdigest(), size] for offset, size in chunk(data)]
+
+
+def remote_manifest(client, remote_dir, release='current'):
+    """Return the manifest of a build on the board (by default the current one), if any."""
+    sftp = client.open_sftp()
+    try:
+        with sftp.open(posixpath.join(remote_dir, release, 'MANIFEST.json'), 'r') as f:
+            return json.loads(f.read().decode('utf-8'))
+    except IOError:
+        return None
+    finally:
+        sftp.close()
+
+
+def plan_delta(manifest, old_manifest, old_release, new_release):
+    """
+    Decide for every block whether it can be copied from a file on the board
+    (of the current build or already assembled in this deployment) or has to be
+    sent. Returns the plan and the list of blocks to send.
+    """
+    known = dict()
+    if old_manifest and old_manifest.get('chunking') == CHUNKING:
+        for f in old_manifest['files']:
+            offset = 0
+            for digest, size in f['blocks']:
+                known.setdefault(digest, (posixpath.join(old_release, f['name']), offset, size))
+                offset += size
+
+    plan_files, literals = [], []
+    for f in manifest['files']:
+        ops, offset = [], 0
+        for digest, size in f['blocks']:
+            if digest in known and known[digest][2] == size:
+                ops.append(['copy'] + list(known[digest]))
+            else:
+                ops.append(['data', size])
+                literals.append((f['name'], offset, size))
+                known[digest] = (posixpath.join(new_release, f['name']), offset, size)
+            offset += size
+        plan_files.append(dict(name=f['name'], mode=f['mode'], sha256=f['sha256'], blocks=ops))
+
+    return plan_files, literals
+
+
+def deploy(board, build_dir, manifest, remote_dir):
+    revision = manifest['revision']
+    client = connect(board)
+    try:
+        old_manifest = remote_manifest(client, remote_dir)
+        if old_manifest and old_manifest.get('release') == manifest['release']:
+            print('{board}: already at {revision}'.format(board=board, revision=revision))
+            return
+
+        old_release = posixpath.join('releases', old_manifest['release']) if old_manifest else None
+        new_release = posixpath.join('releases', manifest['release'])
+
+        # A complete copy of the release may be left from an earlier
+        # deployment (e.g., when rolling back), it is only switched to then.
+        cmds = ['cd {dir}'.format(dir=quote(remote_dir))]
+        existing_manifest = remote_manifest(client, remote_dir, new_release)
+        if existing_manifest and existing_manifest.get('release') == manifest['release']:
+            print('{board}: reusing {release}'.format(board=board, release=manifest['release']))
+        else:
+            add_blocks(manifest, build_dir, old_manifest)
+            files, literals = plan_delta(manifest, old_manifest, old_release, new_release + '.tmp')
+
+            total = sum(size for f in manifest['files'] for _, size in f['blocks'])
+            sent = sum(size for _, _, size in literals)
+            print('{board}: sending {sent} of {total} bytes'.format(board=board, sent=sent, total=total))
+
+            def stream():
+                yield json.dumps(dict(root=remote_dir, dest=posixpath.join(remote_dir, new_release + '.tmp'),
+                                      files=files, manifest=manifest)).encode('utf-8') + b'\n'
+                for name, offset, size in literals:
+                    with open(os.path.join(build_dir, name), 'rb') as f:
+                        f.seek(offset)
+                        yield f.read(size)
+
+            run(client, 'python3 -c {script}'.format(script=quote(ASSEMBLER)), stream())
+            cmds.append('rm -rf {new} && mv {new}.tmp {new}'.format(new=quote(new_release)))
+
+        # Swap the new build in atomically and drop the builds that are
+        # neither current nor the one being replaced.
+        run(client, ' && '.join(cmds + [
+            'ln -sfn {new} current.tmp && mv -Tf current.tmp current'.format(new=quote(new_release)),
+            'for r in releases/*; do [ "$r" = {new} ] || [ "$r" = {old} ] || rm -rf "$r"; done'.format(
+                new=quote(new_release), old=quote(old_release or new_release)),
+        ]))
+        print('{board}: deployed {revision}'.format(board=board, revision=revision))
+    finally:
+        client.close()
+
+
+def check(board, remote_dir):
+    """Return the release (revision and content hash) that the board runs."""
+    client = connect(board)
+    try:
+        manifest = remote_manifest(client, remote_dir)
+    finally:
+        client.close()
+    current = manifest['release'] if manifest else None
+    print('{board}: {current}'.format(board=board, current=current))
+    return current
+
+
+def quote(s):
+    return "'" + s.replace("'", "'\"'\"'") + "'"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--revision', required=True, help='revision of the build (e.g. the WebKit git sha)')
+    parser.add_argument('--build-dir', default='WebKitBuild/Debug', help='local build directory (default: %(default)s)')
+    parser.add_argument('--files', nargs='+', default=['bin/jsc', 'lib/*.so*'],
+                        help='files to deploy, relative to the build directory (default: %(default)s)')
+    parser.add_argument('--remote-dir', default='/home/pi/jsc32-fuzz', help='deployment directory on the boards (default: %(default)s)')
+    parser.add_argument('--check', default=False, action='store_true', help='only check that the boards run the same build of the revision')
+    parser.add_argument('boards', nargs='+', metavar='BOARD', help='board to deploy to, as user@host[:port]')
+    args = parser.parse_args()
+
+    release = None
+    if not args.check:
+        manifest = build_manifest(args.build_dir, args.files, args.revision)
+        if not manifest['files']:
+            sys.exit('No files to deploy under {dir}'.format(dir=args.build_dir))
+        for board in args.boards:
+            deploy(board, args.build_dir, manifest, args.remote_dir)
+        release = manifest['release']
+
+    # Every board has to fuzz the same build, not only the same revision.
+    releases = [check(board, args.remote_dir) for board in args.boards]
+    release = release or releases[0]
+    if not release or not release.startswith(args.revision + '-') or any(r != release for r in releases):
+        sys.exit('Not every board runs the same build of revision {revision}'.format(revision=args.revision))
+
+
+if __name__ == '__main__':
+    main()